@@ -1,12 +1,19 @@
 #
 # Downloads image from S3 using AWS's boto3 library
 #
+import json
 import logging
+import mimetypes
+import os
+import shutil
 import sys
+import threading
 
 import boto3  # access to Amazon Web Services (AWS)
+from boto3.s3.transfer import TransferConfig
 from botocore import UNSIGNED
 from botocore.client import Config
+from botocore.exceptions import ClientError
 
 from configparser import ConfigParser
 
@@ -15,62 +22,203 @@ from configparser import ConfigParser
 #
 sys.tracebacklimit = 0
 
-try:
-    print("**Starting**")
-    print()
-     
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 's3-config.ini'    
-    configur = ConfigParser()
-    configur.read(config_file)
+#
+# copy buffer size when streaming downloads to disk, and the object
+# size above which we switch to a multipart (parallel ranged GET)
+# download:
+#
+MB = 1024 * 1024
+
+MULTIPART_THRESHOLD = 8 * MB
+TARGET_CONCURRENCY = 16
+
+#
+# ETags of previously downloaded objects, so an unchanged object
+# isn't downloaded again:
+#
+ETAG_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.s3cache', 'etags.json')
+
+#
+# setup AWS based on config file:
+#
+config_file = 's3-config.ini'
+configur = ConfigParser()
+configur.read(config_file)
+
+#
+# get bucket info from config file:
+#
+bucket_name = configur.get('bucket', 'bucket_name')
+region_name = configur.get('bucket', 'region_name')
+
+#
+# module-level S3 resource, created once by get_s3() so that
+# repeated downloads reuse the same connection pool:
+#
+_S3 = None
+_S3_LOCK = threading.Lock()
+
+
+###################################################################
+#
+# get_s3
+#
+def get_s3():
+  """
+  Returns the S3 resource used to access CS 310's public photoapp
+  bucket, creating it on the first call.
+  """
+
+  global _S3
+
+  if _S3 is None:
+    with _S3_LOCK:
+      if _S3 is None:
+        _S3 = boto3.resource(
+          's3',
+          region_name=region_name,
+          # enables access to public objects:
+          config=Config(retries = {'max_attempts': 3, 'mode': 'standard'},
+                        signature_version=UNSIGNED,
+                        max_pool_connections=50))
+
+  return _S3
+
+
+###################################################################
+#
+# _load_etags / _save_etags
+#
+# read and write the ETag cache, a JSON dict mapping "bucket/key"
+# to {etag, size, local_path}
+#
+def _load_etags():
+  try:
+    with open(ETAG_CACHE_FILE, 'r') as infile:
+      return json.load(infile)
+  except (OSError, ValueError):
+    return {}
+
+
+def _save_etags(etags):
+  os.makedirs(os.path.dirname(ETAG_CACHE_FILE), exist_ok=True)
+  with open(ETAG_CACHE_FILE, 'w') as outfile:
+    json.dump(etags, outfile)
+
+
+###################################################################
+#
+# download
+#
+def download(imagename):
+  """
+  Downloads the given object from the bucket, saving it locally
+  with an extension based on its content type. If the object was
+  downloaded before and hasn't changed, the local copy is reused.
+
+  Returns
+  -------
+  the local filename the object was saved to
+  """
+
+  s3 = get_s3()
+
+  etags = _load_etags()
+  cache_key = f"{bucket_name}/{imagename}"
+  cached = etags.get(cache_key)
+
+  #
+  # only trust the local copy if it's still there, whole and unedited
+  # as far as its size tells us:
+  #
+  if cached is not None and (not os.path.isfile(cached['local_path'])
+                             or os.path.getsize(cached['local_path']) != cached['size']):
+    cached = None
+
+  #
+  # one GET returns the content type (to pick the extension), the
+  # object size, and the body. If we have the object locally, the
+  # GET is conditional and S3 answers 304 if it hasn't changed:
+  #
+  try:
+    if cached is not None:
+      resp = s3.meta.client.get_object(Bucket=bucket_name, Key=imagename,
+                                       IfNoneMatch=cached['etag'])
+    else:
+      resp = s3.meta.client.get_object(Bucket=bucket_name, Key=imagename)
+  except ClientError as err:
+    if err.response['ResponseMetadata'].get('HTTPStatusCode') == 304:
+      return cached['local_path']
+    raise
+
+  content_type = resp['ContentType'].split(';')[0].strip()
+  extension = mimetypes.guess_extension(content_type) or '.unknown'
+
+  local_filename = imagename + extension
 
+  size = resp['ContentLength']
+
+  if size < MULTIPART_THRESHOLD:
     #
-    # get web server URL from config file:
+    # small object, a single stream is fastest:
     #
-    bucket_name = configur.get('bucket', 'bucket_name')
-    region_name = configur.get('bucket', 'region_name')
-
+    with open(local_filename, 'wb') as outfile:
+      shutil.copyfileobj(resp['Body'], outfile, length=MB)
+  else:
     #
-    # gain access to CS 310's public photoapp bucket:
+    # large object, drop the single stream and fetch in parallel
+    # chunks sized so there's enough parts to keep the threads busy:
     #
-    s3 = boto3.resource(
-      's3',
-      region_name=region_name,
-      # enables access to public objects:
-      config=Config(retries = {'max_attempts': 3, 'mode': 'standard'}, signature_version=UNSIGNED))
+    resp['Body'].close()
+
+    chunksize = max(8 * MB, min(64 * MB, size // TARGET_CONCURRENCY))
+    transfer_config = TransferConfig(
+      multipart_threshold=MULTIPART_THRESHOLD,
+      multipart_chunksize=chunksize,
+      max_concurrency=TARGET_CONCURRENCY,
+      max_io_queue=10000,
+      io_chunksize=262144,
+      use_threads=True)
+
+    s3.meta.client.download_file(bucket_name, imagename, local_filename,
+                                 Config=transfer_config)
 
-    bucket = s3.Bucket(bucket_name)
+  etags[cache_key] = {
+    'etag': resp['ETag'],
+    'size': size,
+    'local_path': os.path.abspath(local_filename),
+  }
+  _save_etags(etags)
+
+  return local_filename
+
+
+###################################################################
+#
+# main
+#
+def main():
+  try:
+    print("**Starting**")
+    print()
 
     #
     # Download image requested by user:
     #
     imagename = input("Enter image to download without extension> ")
     print()
-    object_metadata = s3.Object(bucket_name, imagename).content_type
-    parsed_content_type = "."
-    if 'jpeg' in object_metadata:
-      parsed_content_type += 'jpg'
-    elif 'text/plain' in object_metadata:
-      parsed_content_type += 'txt'
-    elif 'python' in object_metadata:
-      parsed_content_type += 'py'
-    elif 'application' in object_metadata:
-      parsed_content_type += object_metadata.split('/')[1]
-    else:
-      parsed_content_type += 'unknown'
-  
-    local_filename = imagename + parsed_content_type
 
-    bucket.download_file(imagename, local_filename)
-    
+    local_filename = download(imagename)
+
     print(f"Success, image downloaded to '{local_filename}'")
 
     print()
     print("**Done**")
 
-except Exception as err:
-  print()
-  print(f"ERROR:\n Bucket: {bucket_name} \n Region: {region_name} \n Msg: {err}")
+  except Exception as err:
+    print()
+    print(f"ERROR:\n Bucket: {bucket_name} \n Region: {region_name} \n Msg: {err}")
+
 
+if __name__ == "__main__":
+  main()
@@ -5,11 +5,79 @@
 # Northwestern University
 #
 
+import asyncio
+import mimetypes
+import os
+import random
 import requests
 import time
+from requests.adapters import HTTPAdapter
 from configparser import ConfigParser
 import xml.etree.ElementTree as ET
 
+#
+# files larger than RANGE_THRESHOLD are downloaded as concurrent
+# byte-range GETs of RANGE_CHUNKSIZE bytes, at most RANGE_CONCURRENCY
+# in flight at once:
+#
+RANGE_THRESHOLD = 16 << 20
+RANGE_CHUNKSIZE = 16 << 20
+RANGE_CONCURRENCY = 8
+
+
+class RangeRequestError(Exception):
+  """A byte-range GET was not answered with 206 Partial Content."""
+
+
+async def fetch_range(http, sem, url, lo, hi, fd):
+  async with sem:
+    async with http.get(url, headers={'Range': f'bytes={lo}-{hi}'}) as resp:
+      if resp.status != 206:
+        raise RangeRequestError(f"range request for bytes {lo}-{hi} failed, status code {resp.status}")
+
+      offset = lo
+      async for chunk in resp.content.iter_chunked(1 << 20):
+        os.pwrite(fd, chunk, offset)
+        offset += len(chunk)
+
+
+async def download(url, path, size, chunk=RANGE_CHUNKSIZE, conc=RANGE_CONCURRENCY):
+  #
+  # aiohttp is only needed for large files, so small downloads
+  # don't require it to be installed:
+  #
+  import aiohttp
+
+  ranges = [(lo, min(lo + chunk, size) - 1) for lo in range(0, size, chunk)]
+  sem = asyncio.Semaphore(conc)
+
+  fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+  try:
+    #
+    # reserve the whole file up front so the scattered writes land
+    # in already-allocated blocks:
+    #
+    if hasattr(os, 'posix_fallocate'):
+      os.posix_fallocate(fd, 0, size)
+    else:
+      os.ftruncate(fd, size)
+
+    connector = aiohttp.TCPConnector(limit=conc * 2)
+    timeout = aiohttp.ClientTimeout(sock_connect=3.05, sock_read=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+      await asyncio.gather(*[fetch_range(http, sem, url, lo, hi, fd) for (lo, hi) in ranges])
+  except BaseException:
+    #
+    # a failed range leaves a full-size file with zero-filled holes
+    # that looks complete, so remove it:
+    #
+    os.close(fd)
+    os.unlink(path)
+    raise
+
+  os.close(fd)
+
+
 print("**Starting**")
 print()
 
@@ -25,32 +93,55 @@ configur.read(config_file)
 #
 endpoint = configur.get('webserver', 'endpoint')
 
+#
+# one session for all requests, so retries and later downloads
+# reuse keep-alive connections instead of a new TCP+TLS handshake:
+#
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=0)
+session.mount('https://', adapter)
+session.mount('http://', adapter)
+
 #
 # Call S3 web server to download image requested by user:
 #
 imagename = input("Enter image to download without extension> ")
 # + ".azonaws.com.nu.cs"
 url = endpoint + "/" + imagename
-retry = 1
 max_retries = 3
 
-while retry <= max_retries:
+#
+# retry with exponential backoff and full jitter; we only sleep
+# between failed attempts, never after a success:
+#
+response = None
+error = None
+
+for attempt in range(max_retries):
   try:
-    response = requests.get(url)
+    response = session.get(url, timeout=(3.05, 30), stream=True)
     if response.status_code in (200, 404):
       break
-  except Exception as e:
-    if retry == max_retries:
-      response = requests.models.Response()
-      response.status_code = -1
-      root = ET.Element("Error")
-      ET.SubElement(root, "Message").text = str(e)
-      response._content = ET.tostring(root, encoding='UTF-8')
-      break
-  finally:
-    if retry < max_retries:
-      time.sleep(retry)
-      retry += 1
+    #
+    # release the pooled connection before trying again; the last
+    # response is kept open so its error body can be read below:
+    #
+    if attempt < max_retries - 1:
+      response.close()
+  except requests.RequestException as e:
+    response = None
+    error = e
+
+  if attempt < max_retries - 1:
+    delay = random.uniform(0, min(30, 0.5 * 2 ** attempt))
+    time.sleep(delay)
+
+if response is None:
+  response = requests.models.Response()
+  response.status_code = -1
+  root = ET.Element("Error")
+  ET.SubElement(root, "Message").text = str(error)
+  response._content = ET.tostring(root, encoding='UTF-8')
 
 #
 # process the response:
@@ -65,24 +156,30 @@ if status_code == 200:
   #
   # success, write image to a local file so we can view:
   #
-  content_type = response.headers['Content-Type']
-  parsed_content_type = "."
-  if 'jpeg' in content_type:
-    parsed_content_type += 'jpg'
-  elif 'text/plain' in content_type:
-    parsed_content_type += 'txt'
-  elif 'python' in content_type:
-    parsed_content_type += 'py'
-  elif 'application' in content_type:
-    parsed_content_type += content_type.split('/')[1]
-  else:
-    parsed_content_type += 'unknown'
-  
-  imagename = imagename + parsed_content_type
-  file = open(imagename, 'wb')
-  file.write(response.content)
-  file.close()
-  print(f"Success, image downloaded to '{imagename}'")
+  content_type = response.headers['Content-Type'].split(';')[0].strip()
+  extension = mimetypes.guess_extension(content_type) or '.unknown'
+
+  imagename = imagename + extension
+
+  size = int(response.headers.get('Content-Length', 0))
+  ranged = (size > RANGE_THRESHOLD
+            and response.headers.get('Accept-Ranges') == 'bytes'
+            and 'Content-Encoding' not in response.headers)
+
+  try:
+    if ranged:
+      #
+      # large file: drop this stream and fetch byte ranges concurrently:
+      #
+      response.close()
+      asyncio.run(download(url, imagename, size))
+    else:
+      with open(imagename, 'wb') as file:
+        for chunk in response.iter_content(chunk_size=1 << 20):
+          file.write(chunk)
+    print(f"Success, image downloaded to '{imagename}'")
+  except Exception as err:
+    print(f"ERROR:\n URL: {url} \n Msg: {str(err) or type(err).__name__}")
 else:
   #
   # error:
@@ -8,21 +8,150 @@
 #   Northwestern University
 # Alec do Couto
 
+import atexit
+import collections
+import threading
+import time
+
 import pymysql
 from configparser import ConfigParser
+from pymysql.constants import CLIENT
+from cachetools import TTLCache
+from dbutils.pooled_db import PooledDB
+
+
+#
+# module-level variables:
+#
+_CFG = None
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+#
+# short url -> long url mappings never change once written (only a
+# reset removes them), so get_url caches them in memory. If another
+# process resets the table, the next flush of lookup counts finds
+# the rows gone and evicts them (see _flush_counts); the TTL is a
+# backstop:
+#
+_URL_CACHE = TTLCache(maxsize=100_000, ttl=300)
+_URL_CACHE_LOCK = threading.Lock()
+
+#
+# LookedUpCount increments are not written by get_url itself; they
+# are queued here and flushed to the database in one UPDATE every
+# _FLUSH_INTERVAL seconds by a background thread. _inflight holds
+# the batch currently being written so get_stats never undercounts.
+# _flush_gen is odd while a batch is being committed and bumped back
+# to even once _inflight no longer holds it, so get_stats can tell
+# whether its read raced a commit without locking across the query:
+#
+_FLUSH_INTERVAL = 2.0
+_pending = collections.Counter()
+_inflight = collections.Counter()
+_flush_gen = 0
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flusher = None
+
+#
+# SQL used by the API functions. The hot lookups are also prepared
+# server-side on every pooled connection (see _get_pool), so later
+# calls just EXECUTE them instead of having MySQL re-parse the text:
+#
+_SELECT_URL = "SELECT LongUrl FROM LinksTable WHERE ShortUrl = ?"
+_SELECT_COUNT = "SELECT LookedUpCount FROM LinksTable WHERE ShortUrl = ?"
+
+_PREPARE_SQL = [
+  f"PREPARE stmt_select_url FROM '{_SELECT_URL}'",
+  f"PREPARE stmt_select_count FROM '{_SELECT_COUNT}'",
+]
+
+_GET_URL_SQL = """
+  SET @shorturl = %s;
+  EXECUTE stmt_select_url USING @shorturl;
+  """
+_GET_STATS_SQL = """
+  SET @shorturl = %s;
+  EXECUTE stmt_select_count USING @shorturl;
+  """
+_CHECK_URL_SQL = "SELECT LongUrl FROM LinksTable WHERE ShortUrl = %s"
+_INSERT_LINK_SQL = "INSERT INTO LinksTable (ShortUrl, LongUrl, LookedUpCount) VALUES(%s, %s, 0)"
+_DELETE_ALL_SQL = "DELETE FROM LinksTable"
+
+
+###################################################################
+#
+# _get_cfg
+#
+# parses shorten-config.ini on first use and returns the cached
+# parser on every call after that
+#
+def _get_cfg():
+  global _CFG
+
+  if _CFG is None:
+    config_file = 'shorten-config.ini'
+    configur = ConfigParser()
+    configur.read(config_file)
+    _CFG = configur
+
+  return _CFG
+
+
+###################################################################
+#
+# _get_pool
+#
+# creates the connection pool on first use, based on configuration
+# information in shorten-config.ini, and returns it
+#
+def _get_pool():
+  global _POOL
+
+  if _POOL is None:
+    with _POOL_LOCK:
+      if _POOL is None:
+        configur = _get_cfg()
+
+        endpoint = configur.get('rds', 'endpoint')
+        portnum = int(configur.get('rds', 'port_number'))
+        username = configur.get('rds', 'user_name')
+        pwd = configur.get('rds', 'user_pwd')
+        dbname = configur.get('rds', 'db_name')
+
+        #
+        # blocking: when all connections are checked out, callers
+        # wait for one to be returned instead of failing:
+        #
+        _POOL = PooledDB(creator=pymysql,
+                         maxconnections=10,
+                         blocking=True,
+                         mincached=2,
+                         host=endpoint,
+                         port=portnum,
+                         user=username,
+                         passwd=pwd,
+                         database=dbname,
+                         client_flag=CLIENT.MULTI_STATEMENTS,
+                         setsession=_PREPARE_SQL)
+
+  return _POOL
 
 
 ###################################################################
 #
 # get_dbConn
 #
-# create and return connection object, based on configuration
+# return a connection object from the pool, based on configuration
 # information in shorten-config.ini
 #
 def get_dbConn():
   """
-  Reads the configuration info from shorten-config.ini, creates
-  a pymysql connection object based on this info, and returns it
+  Returns a pymysql connection taken from a pool that is created
+  on first use from the info in shorten-config.ini. Calling close()
+  on the connection returns it to the pool rather than closing the
+  underlying socket.
 
   Parameters
   ----------
@@ -30,33 +159,11 @@ def get_dbConn():
 
   Returns
   -------
-  pymysql connection object
+  pooled pymysql connection object
   """
 
   try:
-    #
-    # obtain database server config info:
-    #
-    config_file = 'shorten-config.ini'    
-    configur = ConfigParser()
-    configur.read(config_file)
-
-    endpoint = configur.get('rds', 'endpoint')
-    portnum = int(configur.get('rds', 'port_number'))
-    username = configur.get('rds', 'user_name')
-    pwd = configur.get('rds', 'user_pwd')
-    dbname = configur.get('rds', 'db_name')
-
-    #
-    # now create connection object and return it:
-    #
-    dbConn = pymysql.connect(host=endpoint,
-                            port=portnum,
-                            user=username,
-                            passwd=pwd,
-                            database=dbname)
-
-    return dbConn
+    return _get_pool().connection()
   
   except Exception as err:
     print("**ERROR in shorten.get_dbConn():")
@@ -64,6 +171,114 @@ def get_dbConn():
     return None
   
 
+###################################################################
+#
+# _count_lookup
+#
+# queues one lookup of the given short url, starting the background
+# flusher on first use
+#
+def _count_lookup(shorturl):
+  global _flusher
+
+  with _pending_lock:
+    _pending[shorturl] += 1
+
+    if _flusher is None:
+      _flusher = threading.Thread(target=_flush_loop, daemon=True)
+      _flusher.start()
+
+
+###################################################################
+#
+# _flush_counts
+#
+# writes all queued lookup counts to the database with a single
+# UPDATE statement. If fewer rows match than urls in the batch, some
+# were deleted (e.g. by another process), so the batch's urls are
+# evicted from the url cache and looked up again next time
+#
+def _flush_counts():
+  global _flush_gen
+
+  with _flush_lock:
+    with _pending_lock:
+      if not _pending:
+        return
+      _inflight.update(_pending)
+      _pending.clear()
+      batch = list(_inflight.items())
+
+    dbConn = None
+    committing = False
+
+    try:
+      dbConn = get_dbConn()
+      dbConn.begin()
+      dbCursor = dbConn.cursor()
+
+      cases = " ".join(["WHEN %s THEN %s"] * len(batch))
+      keys = ", ".join(["%s"] * len(batch))
+      update_sql = f"""
+        UPDATE LinksTable
+          SET LookedUpCount = LookedUpCount + CASE ShortUrl {cases} END
+          WHERE ShortUrl IN ({keys})
+        """
+
+      params = [value for pair in batch for value in pair]
+      params += [shorturl for (shorturl, _) in batch]
+
+      dbCursor.execute(update_sql, params)
+      matched = dbCursor.rowcount
+
+      with _pending_lock:
+        _flush_gen += 1
+        committing = True
+
+      dbConn.commit()
+
+      with _pending_lock:
+        _inflight.clear()
+        _flush_gen += 1
+        committing = False
+
+      if matched < len(batch):
+        with _URL_CACHE_LOCK:
+          for (shorturl, _) in batch:
+            _URL_CACHE.pop(shorturl, None)
+
+    except Exception as err:
+      print("**ERROR in shorten._flush_counts():")
+      print(str(err))
+      if dbConn is not None: dbConn.rollback()
+      #
+      # requeue so the counts are retried on the next flush:
+      #
+      with _pending_lock:
+        _pending.update(_inflight)
+        _inflight.clear()
+        if committing:
+          _flush_gen += 1
+
+    finally:
+      if dbConn is not None: dbConn.close()
+
+
+###################################################################
+#
+# _flush_loop
+#
+# body of the background flusher thread
+#
+def _flush_loop():
+  while True:
+    time.sleep(_FLUSH_INTERVAL)
+    _flush_counts()
+
+
+atexit.register(_flush_counts)
+
+
 ###################################################################
 #
 # get_url
@@ -87,36 +302,61 @@ def get_url(shorturl):
   long URL (string), or empty string if short URL not found
   """
 
-  try:
-    dbConn = get_dbConn()
-
-    longurl = ""
-    select_sql = "SELECT LongUrl FROM LinksTable WHERE ShortUrl = %s"
-    update_sql = "UPDATE LinksTable SET LookedUpCount = LookedUpCount + 1 WHERE ShortUrl = %s"
-    
-    dbConn.begin()
-    dbCursor = dbConn.cursor()
+  dbConn = None
 
-    dbCursor.execute(update_sql, (shorturl,))
+  try:
+    with _URL_CACHE_LOCK:
+      longurl = _URL_CACHE.get(shorturl)
+
+    if longurl is None:
+      dbConn = get_dbConn()
+      dbCursor = dbConn.cursor()
+
+      #
+      # the SELECT's rows are in the second result set (after
+      # the SET):
+      #
+      dbCursor.execute(_GET_URL_SQL, (shorturl,))
+      dbCursor.nextset()
+      row = dbCursor.fetchone()
+      if row is None:
+        return ""
 
-    dbCursor.execute(select_sql, (shorturl,))
-    row = dbCursor.fetchone()
-    if row:
       longurl = row[0]
-    
-    dbConn.commit()
+      with _URL_CACHE_LOCK:
+        _URL_CACHE[shorturl] = longurl
+
+    #
+    # count the lookup; the database is updated in the background:
+    #
+    _count_lookup(shorturl)
     return longurl
 
   except Exception as err:
     print("**ERROR in shorten.get_url():")
     print(str(err))
-    dbConn.rollback()
     return ""
 
   finally:
     if dbConn is not None: dbConn.close()
 
 
+##################################################################
+#
+# _read_count
+#
+# returns the row holding the given short url's LookedUpCount in the
+# database, ending the transaction so a repeated read sees batches
+# committed since
+#
+def _read_count(dbConn, dbCursor, shorturl):
+  dbCursor.execute(_GET_STATS_SQL, (shorturl,))
+  dbCursor.nextset()
+  row = dbCursor.fetchone()
+  dbConn.commit()
+  return row
+
+
 ##################################################################
 #
 # get_stats
@@ -137,16 +377,38 @@ def get_stats(shorturl):
   the count associated with the short url, -1 if short URL not found
   """
 
+  dbConn = None
+
   try:
     dbConn = get_dbConn()
-    select_sql = "SELECT LookedUpCount FROM LinksTable WHERE ShortUrl = %s"
 
     dbCursor = dbConn.cursor()
 
-    dbCursor.execute(select_sql, (shorturl,))
-    row = dbCursor.fetchone()
+    #
+    # add the queued lookups to the count in the database. If a
+    # batch was committed while we read, we can't tell whether the
+    # read saw it, so read again; that is rare, so after a few tries
+    # we hold the flush lock for one last read:
+    #
+    for attempt in range(3):
+      with _pending_lock:
+        gen = _flush_gen
+
+      row = _read_count(dbConn, dbCursor, shorturl)
+
+      with _pending_lock:
+        if gen % 2 == 0 and _flush_gen == gen:
+          queued = _pending[shorturl] + _inflight[shorturl]
+          break
+    else:
+      with _flush_lock:
+        row = _read_count(dbConn, dbCursor, shorturl)
+
+        with _pending_lock:
+          queued = _pending[shorturl] + _inflight[shorturl]
+
     if row:
-      return row[0]
+      return row[0] + queued
     else:
       return -1
 
@@ -185,14 +447,15 @@ def put_shorturl(longurl, shorturl):
   True if successful, False if not
   """
 
+  dbConn = None
+
   try:
     dbConn = get_dbConn()
 
     dbConn.begin()
     dbCursor = dbConn.cursor()
 
-    check_sql = "SELECT LongUrl FROM LinksTable WHERE ShortUrl = %s"
-    dbCursor.execute(check_sql, (shorturl,))
+    dbCursor.execute(_CHECK_URL_SQL, (shorturl,))
     row = dbCursor.fetchone()
     if row:
       if row[0] == longurl:
@@ -202,16 +465,18 @@ def put_shorturl(longurl, shorturl):
         dbConn.commit()
         return False
       
-    insert_sql = "INSERT INTO LinksTable (ShortUrl, LongUrl, LookedUpCount) VALUES(%s, %s, 0)"
-    dbCursor.execute(insert_sql, (shorturl, longurl))
+    dbCursor.execute(_INSERT_LINK_SQL, (shorturl, longurl))
     dbConn.commit()
+
+    with _URL_CACHE_LOCK:
+      _URL_CACHE.pop(shorturl, None)
     
     return True
 
   except Exception as err:
     print("**ERROR in shorten.put_shorturl():")
     print(str(err))
-    dbConn.rollback()
+    if dbConn is not None: dbConn.rollback()
     return False
 
   finally:
@@ -237,21 +502,35 @@ def put_reset():
   True if successful, False if not
   """
 
+  dbConn = None
+
   try:
     dbConn = get_dbConn()
     dbConn.begin()
     
     dbCursor = dbConn.cursor()
-    delete_sql = "DELETE FROM LinksTable"
 
-    dbCursor.execute(delete_sql)
-    dbConn.commit()
+    #
+    # hold the flush lock so no batch is being written (or requeued
+    # after a failed write) while the table is cleared; the queued
+    # counts belong to the deleted urls, so they are dropped too:
+    #
+    with _flush_lock:
+      dbCursor.execute(_DELETE_ALL_SQL)
+      dbConn.commit()
+
+      with _pending_lock:
+        _pending.clear()
+        _inflight.clear()
+
+    with _URL_CACHE_LOCK:
+      _URL_CACHE.clear()
     return True
   
   except Exception as err:
     print("**ERROR in shorten.put_reset():")
     print(str(err))
-    dbConn.rollback()
+    if dbConn is not None: dbConn.rollback()
     return False
 
   finally:
@@ -80,6 +80,59 @@ class URLShortenerTests(unittest.TestCase):
       #
       print("test passed!")
 
+    #
+    # unit test #2:
+    #
+    def test_queued_counts(self):
+      print()
+      print("** test_queued_counts: lookup counts queued and flushed **")
+
+      longurl = "https://" + str(uuid.uuid4()) + ".html"
+      shorturl = "https://" + str(uuid.uuid4())
+
+      success = shorten.put_shorturl(longurl, shorturl)
+      self.assertEqual(success, True)
+
+      # look up several times; the counts are queued, not written:
+      for i in range(3):
+        url = shorten.get_url(shorturl)
+        self.assertEqual(url, longurl)
+
+      # queued lookups are included in the stats:
+      count = shorten.get_stats(shorturl)
+      self.assertEqual(count, 3)
+
+      # flushing writes them to the database, counted once:
+      shorten._flush_counts()
+      count = shorten.get_stats(shorturl)
+      self.assertEqual(count, 3)
+
+      # more lookups on top of the flushed count:
+      url = shorten.get_url(shorturl)
+      self.assertEqual(url, longurl)
+      count = shorten.get_stats(shorturl)
+      self.assertEqual(count, 4)
+
+      # a reset drops the queued count as well as the url:
+      success = shorten.put_reset()
+      self.assertEqual(success, True)
+
+      success = shorten.put_shorturl(longurl, shorturl)
+      self.assertEqual(success, True)
+
+      shorten._flush_counts()
+      count = shorten.get_stats(shorturl)
+      self.assertEqual(count, 0)
+
+      # cleanup:
+      success = shorten.put_reset()
+      self.assertEqual(success, True)
+
+      #
+      # end of test
+      #
+      print("test passed!")
+
       
 ############################################################
 #
@@ -6,6 +6,7 @@ import requests
 import pathlib
 import sys
 import base64
+import json
 
 # eliminate traceback so we just get error message:
 sys.tracebacklimit = 0
@@ -32,21 +33,18 @@ infile.close()
 
 #
 # now encode the pdf as base64. Note b64encode returns
-# a bytes object, not a string. So then we have to convert
-# (decode) the bytes -> string, and then we can serialize
-# the string as JSON for upload to server:
+# a bytes object, not a string. Base64 output is plain ASCII,
+# so rather than decode it to a string (a second copy of the
+# encoded image) just to serialize it, we build the JSON body
+# as bytes around it:
 #
-data = base64.b64encode(bytes)
-datastr = data.decode()
-
-data = {
-  "name": filename, 
-  "bytes": datastr
-}
+data = (b'{"name": ' + json.dumps(filename).encode()
+        + b', "bytes": "' + base64.b64encode(bytes) + b'"}')
 
 print(f"Calling web service to analyze '{filename}'...")
 
-response = requests.put(url, json=data)
+response = requests.put(url, data=data,
+                        headers={'Content-Type': 'application/json'})
 
 #
 # what did we get back?
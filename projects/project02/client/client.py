@@ -10,6 +10,8 @@ import photoapp
 import logging
 import sys
 
+from concurrent.futures import ThreadPoolExecutor, wait
+
 
 ###################################################################
 #
@@ -21,6 +23,12 @@ import sys
 #
 sys.tracebacklimit = 0
 
+#
+# buffer stdout instead of writing each line as it is printed; the
+# output is flushed once at the end:
+#
+sys.stdout.reconfigure(line_buffering=False, write_through=False)
+
 #
 # capture logging output in file 'log.txt'
 #
@@ -48,12 +56,27 @@ if not success:
 
 print()
 
+#
+# the API calls below are independent HTTP round trips, so they are
+# dispatched in phases on a thread pool: the reads before the upload
+# run together, then post_image, then the reads after it, and finally
+# delete_images. Results are printed in the original order.
+#
+executor = ThreadPoolExecutor(max_workers=8)
+
+before_post = {
+  'get_ping': executor.submit(photoapp.get_ping),
+  'get_users': executor.submit(photoapp.get_users),
+  'get_images': executor.submit(photoapp.get_images, 80001),
+}
+wait(before_post.values())
+
 #
 # get_ping:
 #
 try:
   print("**get_ping:")
-  (M,N) = photoapp.get_ping()
+  (M,N) = before_post['get_ping'].result()
   print(f"M: {M}")
   print(f"N: {N}")
 
@@ -68,10 +91,10 @@ print()
 #
 try:
   print("**get_users:")
-  users = photoapp.get_users()
+  users = before_post['get_users'].result()
 
-  for user in users:
-    print(user)
+  if users:
+    print('\n'.join(map(str, users)))
     
 except Exception as err:
   print("CLIENT ERROR:")
@@ -82,10 +105,10 @@ except Exception as err:
 #
 try:
   print("**get_images:")
-  images = photoapp.get_images(80001)
+  images = before_post['get_images'].result()
 
-  for image in images:
-    print(image)
+  if images:
+    print('\n'.join(map(str, images)))
     
 except Exception as err:
   print("CLIENT ERROR:")
@@ -118,12 +141,19 @@ print()
 print("**done**")
 print()
 
+after_post = {
+  'get_image': executor.submit(photoapp.get_image, 1014, "01degu.jpg"),
+  'get_image_labels': executor.submit(photoapp.get_image_labels, 1014),
+  'get_images_with_label': executor.submit(photoapp.get_images_with_label, "rodent"),
+}
+wait(after_post.values())
+
 #
 # get_image:
 #
 try:
   print("**get_image:")
-  filename = photoapp.get_image(1014, "01degu.jpg")
+  filename = after_post['get_image'].result()
 
   print(filename)
     
@@ -143,7 +173,7 @@ print()
 #
 try:
   print("**get_image_labels:")
-  filename = photoapp.get_image_labels(1014)
+  filename = after_post['get_image_labels'].result()
 
   print(filename)
     
@@ -163,7 +193,7 @@ print()
 #
 try:
   print("**get_images_with_label:")
-  filename = photoapp.get_images_with_label("rodent")
+  filename = after_post['get_images_with_label'].result()
 
   print(filename)
     
@@ -171,6 +201,8 @@ except Exception as err:
   print("CLIENT ERROR:")
   print(str(err))
 
+executor.shutdown()
+
 #
 # done:
 #
@@ -196,4 +228,6 @@ except Exception as err:
 #
 print()
 print("**done**")
-print()
\ No newline at end of file
+print()
+
+sys.stdout.flush()
@@ -9,19 +9,161 @@
 #
 
 import base64
+import contextlib
+import functools
+import json
 import logging
+import mmap
 import os
 import requests
-from requests.exceptions import HTTPError, ConnectionError, Timeout
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from requests.exceptions import HTTPError, ConnectionError, ConnectTimeout, Timeout, ChunkedEncodingError
+from cachetools import TTLCache, cached
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
+from operator import itemgetter
+from urllib.parse import unquote
+
+#
+# use the fastest JSON library available; _dumps returns bytes:
+#
+try:
+  import orjson
+  _loads = orjson.loads
+  _dumps = orjson.dumps
+except ImportError:
+  try:
+    import ujson
+    _loads = ujson.loads
+    _dumps = lambda obj: ujson.dumps(obj).encode()
+  except ImportError:
+    _loads = json.loads
+    _dumps = lambda obj: json.dumps(obj).encode()
+
+#
+# responses are requested compressed; brotli is only offered when a
+# decoder is installed, since urllib3 can't decode it otherwise:
+#
+try:
+  import brotli
+  _ACCEPT_ENCODING = "gzip, br"
+except ImportError:
+  try:
+    import brotlicffi
+    _ACCEPT_ENCODING = "gzip, br"
+  except ImportError:
+    _ACCEPT_ENCODING = "gzip"
 
 
 #
 # module-level varibles:
 #
+_log = logging.getLogger(__name__)
+
 WEB_SERVICE_URL = 'set via call to initialize()'
 
+#
+# request URLs, built once by initialize() from WEB_SERVICE_URL;
+# the *_PREFIX URLs take an id or label appended to the end:
+#
+_URL_PING = None
+_URL_USERS = None
+_URL_IMAGES = None
+_URL_IMAGE_PREFIX = None
+_URL_IMAGE_LABELS_PREFIX = None
+_URL_IMAGES_WITH_LABEL_PREFIX = None
+
+#
+# shared HTTP session, created by initialize(), so every API call
+# reuses pooled keep-alive connections instead of opening a new
+# TCP+TLS connection per request:
+#
+_SESSION = None
+
+#
+# (connect, read) timeout for every request sent through the shared
+# session (see _TimeoutAdapter), so a hung socket surfaces as a
+# Timeout (and is retried) instead of blocking:
+#
+_TIMEOUT = (3.05, 30)
+
+#
+# post_image waits for the server to upload the image to S3 and run
+# Rekognition on it before answering, so it gets a longer read timeout:
+#
+_POST_TIMEOUT = (3.05, 300)
+
+#
+# max # of pooled connections per host in the shared session:
+#
+_POOL_MAXSIZE = 32
+
+#
+# bytes of the image read and base64-encoded at a time by post_image:
+#
+_UPLOAD_CHUNKSIZE = 48 * 1024
+
+#
+# bytes written at a time by get_image when streaming to disk:
+#
+_DOWNLOAD_CHUNKSIZE = 64 * 1024
+
+#
+# base64 characters decoded at a time when get_image falls back to
+# a JSON response; a multiple of 4 so each slice decodes on its own:
+#
+_B64_SLICE = 64 * 1024
+
+#
+# build the tuples returned by the list functions from the rows
+# (dictionaries) in the web service's response; list(map(...)) with
+# these runs the whole per-row loop in C:
+#
+_USER_GET = itemgetter("userid", "username", "givenname", "familyname")
+_IMG_GET = itemgetter("assetid", "userid", "localname", "bucketkey")
+_LBL_GET = itemgetter("label", "confidence")
+_IMGLBL_GET = itemgetter("assetid", "label", "confidence")
+
+#
+# successful results of the read-only label lookups are cached for
+# a short time, keyed on the argument; post_image and delete_images
+# clear them. get_users is cached until delete_images. Callers share
+# the cached lists, so they must not modify them:
+#
+_IMAGE_LABELS_CACHE = TTLCache(maxsize=256, ttl=30)
+_IMAGES_WITH_LABEL_CACHE = TTLCache(maxsize=256, ttl=30)
+_CACHE_LOCK = threading.Lock()
+
+
+#
+# retry policy shared by the API functions: only network-level
+# failures are retried (including a keep-alive connection dropped
+# mid-response), with short backoff since the usual fault is a
+# stale pooled socket that succeeds right away on a fresh one. The
+# request is sent once more after the last backoff. Requests that
+# aren't idempotent (POST) are only retried when no connection was
+# ever made (see _never_sent): once the request may have been sent,
+# a timeout, a dropped connection or a broken response can all mean
+# the server already did the work:
+#
+_IDEMPOTENT = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+_RETRY_ON = (ConnectionError, Timeout, ChunkedEncodingError)
+_BACKOFFS = (0.1, 0.4, 1.6)
+
+
+class _TimeoutAdapter(HTTPAdapter):
+  #
+  # applies _TIMEOUT to every request sent through the session that
+  # doesn't pass its own timeout, so no call can block forever:
+  #
+  def send(self, request, timeout=None, **kwargs):
+    if timeout is None:
+      timeout = _TIMEOUT
+    return super().send(request, timeout=timeout, **kwargs)
+
 
 def _validate_local_filename(local_filename):
   if local_filename is None:
@@ -36,18 +178,143 @@ def _validate_local_filename(local_filename):
   return local_filename
 
 
-def _build_url(path):
-  base = WEB_SERVICE_URL.rstrip('/')
-  return f"{base}{path}"
+@contextlib.contextmanager
+def _map_file(infile):
+  #
+  # memory-maps the open file and yields a read-only view of its
+  # bytes, so the kernel pages the file in on demand rather than
+  # copying it into Python buffers (mmap rejects empty files):
+  #
+  if os.fstat(infile.fileno()).st_size == 0:
+    yield b''
+    return
+
+  mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+  view = memoryview(mm)
+  try:
+    yield view
+  finally:
+    view.release()
+    mm.close()
+
+
+def _json_upload_body(filename, image):
+  #
+  # yields the body {"local_filename": ..., "data": <base64>} in
+  # pieces; the chunk size is a multiple of 3 so each chunk encodes
+  # to base64 without padding and the pieces concatenate correctly:
+  #
+  yield b'{"local_filename": ' + _dumps(os.path.basename(filename)) + b', "data": "'
+
+  for i in range(0, len(image), _UPLOAD_CHUNKSIZE):
+    yield base64.b64encode(image[i:i + _UPLOAD_CHUNKSIZE])
+
+  yield b'"}'
+
+
+def _error_message(response):
+  #
+  # error bodies are normally a small JSON {message: ...}, but a
+  # gateway may answer with HTML; only parse what looks like JSON,
+  # otherwise use the (truncated) text itself as the message:
+  #
+  if response.content.lstrip()[:1] == b'{':
+    try:
+      body = _loads(response.content)
+      if isinstance(body, dict):
+        return body.get('message', '')
+    except ValueError:
+      pass
+
+  return response.text[:512]
+
+
+def _filename_to_save(assetid, original_filename, local_filename, local_dir, claim):
+  if local_filename is not None:
+    filename = local_filename
+  elif claim is not None:
+    filename = claim(assetid, original_filename)
+  else:
+    filename = original_filename
+
+  if local_dir is not None:
+    filename = os.path.join(local_dir, filename)
+
+  return filename
+
+
+def _clear_label_caches():
+  with _CACHE_LOCK:
+    _IMAGE_LABELS_CACHE.clear()
+    _IMAGES_WITH_LABEL_CACHE.clear()
+
+
+def _never_sent(err):
+  #
+  # True if the request failed before a connection was made, so the
+  # server can't have seen it: the connect timed out, or the socket
+  # couldn't be opened (refused, DNS failure, ...). Any other
+  # ConnectionError, e.g. the server closing the connection after
+  # reading the body, may come after the request was sent:
+  #
+  if isinstance(err, ConnectTimeout):
+    return True
+
+  if isinstance(err, ConnectionError) and err.args:
+    reason = getattr(err.args[0], 'reason', None)
+    return isinstance(reason, NewConnectionError)
+
+  return False
+
+
+def _do(method, url, make_data=None, **kw):
+  #
+  # sends the request over the shared session, retrying per the
+  # policy above; make_data, if given, returns the request body and
+  # is called for every attempt, since a streamed body can only be
+  # sent once:
+  #
+  for delay in _BACKOFFS:
+    try:
+      if make_data is not None:
+        kw['data'] = make_data()
+      return _SESSION.request(method, url, **kw)
+    except _RETRY_ON as err:
+      if method not in _IDEMPOTENT and not _never_sent(err):
+        raise
+      time.sleep(delay)
+
+  if make_data is not None:
+    kw['data'] = make_data()
+  return _SESSION.request(method, url, **kw)
 
 
 def _safe_json(response):
   try:
-    return response.json()
+    return _loads(response.content)
   except ValueError:
     msg = f"status code {response.status_code}: invalid JSON response"
     raise HTTPError(msg)
 
+def _require_200(response, bad_id_on_400=False):
+  #
+  # returns the decoded JSON body of a successful response, and
+  # raises an HTTPError otherwise. For the functions that take an
+  # id, bad_id_on_400 is True: a 400 then means the id is invalid,
+  # which is a ValueError. These exceptions are not retried, since
+  # we reached the server and the server-side failed, and we are
+  # assuming the server-side is also doing retries:
+  #
+  if response.status_code == 200:
+    return _safe_json(response)
+
+  msg = _error_message(response)
+  if bad_id_on_400 and response.status_code == 400:
+    raise ValueError(msg)
+
+  raise HTTPError(f"status code {response.status_code}: {msg}")
+
+
 ###################################################################
 #
 # initialize
@@ -82,20 +349,48 @@ def initialize(client_config_file):
     #
     # extract and save URL of web service for other API functions:
     #
-    global WEB_SERVICE_URL
+    global WEB_SERVICE_URL, _SESSION
+    global _URL_PING, _URL_USERS, _URL_IMAGES, _URL_IMAGE_PREFIX
+    global _URL_IMAGE_LABELS_PREFIX, _URL_IMAGES_WITH_LABEL_PREFIX
 
     configur = ConfigParser()
     configur.read(client_config_file)
     WEB_SERVICE_URL = configur.get('client', 'webservice')
 
+    base = WEB_SERVICE_URL.rstrip('/')
+    _URL_PING = base + '/ping'
+    _URL_USERS = base + '/users'
+    _URL_IMAGES = base + '/images'
+    _URL_IMAGE_PREFIX = base + '/image/'
+    _URL_IMAGE_LABELS_PREFIX = base + '/image_labels/'
+    _URL_IMAGES_WITH_LABEL_PREFIX = base + '/images_with_label/'
+
+    #
+    # create the shared session with a modest connection pool and
+    # a default timeout on every request:
+    #
+    _SESSION = requests.Session()
+    adapter = _TimeoutAdapter(pool_connections=4, pool_maxsize=_POOL_MAXSIZE, max_retries=0)
+    _SESSION.mount('http://', adapter)
+    _SESSION.mount('https://', adapter)
+    _SESSION.headers.update({"Connection": "keep-alive",
+                             "Accept-Encoding": _ACCEPT_ENCODING})
+
+    #
+    # results cached from a previous initialize() may come from a
+    # different web service:
+    #
+    get_users.cache_clear()
+    _clear_label_caches()
+
     #
     # success:
     #
     return True
 
   except Exception as err:
-    logging.error("initialize():")
-    logging.error(str(err))
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "initialize", err)
     raise
 
 
@@ -114,11 +409,6 @@ def initialize(client_config_file):
 # will be an error message. Hopefully the error messages will
 # convey what is going on (e.g. no internet connection).
 #
-@retry(stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((ConnectionError, Timeout)),
-        reraise=True
-      )
 def get_ping():
   """
   Based on the configuration file, retrieves the # of items in the S3 bucket and
@@ -139,37 +429,19 @@ def get_ping():
   """
 
   try:
-    url = _build_url("/ping")
+    url = _URL_PING
 
-    response = requests.get(url)
-    body = _safe_json(response)
+    response = _do('GET', url)
 
-    if response.status_code == 200:
-      #
-      # success
-      #
-      M = body['M']
-      N = body['N']
-      return (M, N)
-    else:
-      #
-      # failed:
-      #
-      msg = body['message']
-      err_msg = f"status code {response.status_code}: {msg}"
-      #
-      # NOTE: this exception will not trigger retry mechanism, 
-      # since we reached the server and the server-side failed, 
-      # and we are assuming the server-side is also doing retries.
-      #
-      raise HTTPError(err_msg)
+    body = _require_200(response)
+
+    M = body['M']
+    N = body['N']
+    return (M, N)
 
   except Exception as err:
-    logging.error("get_ping():")
-    logging.error(str(err))
-    #
-    # raise exception to trigger retry mechanism if appropriate:
-    #
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "get_ping", err)
     raise
 
   finally:
@@ -181,11 +453,7 @@ def get_ping():
 #
 # get_users
 #
-@retry(stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((ConnectionError, Timeout)),
-        reraise=True
-      )
+@functools.lru_cache(maxsize=1)
 def get_users():
   """
   Returns a list of all the users in the database. Each element 
@@ -206,53 +474,23 @@ def get_users():
   """
 
   try:
-    url = _build_url("/users")
+    url = _URL_USERS
 
-    response = requests.get(url)
-    body = _safe_json(response)
+    response = _do('GET', url)
 
-    if response.status_code == 200:
-      #
-      # success
-      #
-      rows = body['data']
+    body = _require_200(response)
+    rows = body['data']
 
-      # 
-      # rows is a dictionary-like list of objects, so
-      # let's extract the values and discard the keys
-      # to honor the API's return value:
-      #
-      users = []
-
-      for row in rows:
-        userid = row["userid"]
-        username = row["username"]
-        givenname = row["givenname"]
-        familyname = row["familyname"]
-        #
-        user = (userid, username, givenname, familyname)
-        users.append(user)
-
-      return users
-    else:
-      #
-      # failed:
-      #
-      msg = body['message']
-      err_msg = f"status code {response.status_code}: {msg}"
-      #
-      # NOTE: this exception will not trigger retry mechanism, 
-      # since we reached the server and the server-side failed, 
-      # and we are assuming the server-side is also doing retries.
-      #
-      raise HTTPError(err_msg)
+    # 
+    # rows is a dictionary-like list of objects, so
+    # let's extract the values and discard the keys
+    # to honor the API's return value:
+    #
+    return list(map(_USER_GET, rows))
 
   except Exception as err:
-    logging.error("get_users():")
-    logging.error(str(err))
-    #
-    # raise exception to trigger retry mechanism if appropriate:
-    #
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "get_users", err)
     raise
 
   finally:
@@ -264,11 +502,6 @@ def get_users():
 #
 # get_images
 #
-@retry(stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((ConnectionError, Timeout)),
-        reraise=True
-      )
 def get_images(userid = None):
   """
   Returns a list of all the images in the database. Each element 
@@ -292,52 +525,21 @@ def get_images(userid = None):
   """
 
   try:
-    url = _build_url("/images")
+    url = _URL_IMAGES
 
     params = {}
     if userid is not None:
       params['userid'] = userid
 
-    response = requests.get(url, params=params)
-    body = _safe_json(response)
-
-    if response.status_code == 200:
-      #
-      # success
-      #
-      rows = body['data']
-
+    response = _do('GET', url, params=params)
 
-      images = []
+    body = _require_200(response)
+    rows = body['data']
 
-      for row in rows:
-        assetid = row["assetid"]
-        userid = row["userid"]
-        localname = row["localname"]
-        bucketkey = row["bucketkey"]
-
-        image = (assetid, userid, localname, bucketkey)
-        images.append(image)
-
-      return images
-    else:
-      #
-      # failed:
-      #
-      msg = body['message']
-      err_msg = f"status code {response.status_code}: {msg}"
-      #
-      # NOTE: this exception will not trigger retry mechanism, 
-      # since we reached the server and the server-side failed, 
-      # and we are assuming the server-side is also doing retries.
-      #
-      raise HTTPError(err_msg)
+    return list(map(_IMG_GET, rows))
   except Exception as err:
-    logging.error("get_images():")
-    logging.error(str(err))
-    #
-    # raise exception to trigger retry mechanism if appropriate:
-    #
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "get_images", err)
     raise
   finally:
     # nothing to do
@@ -347,11 +549,6 @@ def get_images(userid = None):
 #
 # post_image
 #
-@retry(stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((ConnectionError, Timeout)),
-        reraise=True
-      )
 def post_image(userid, local_filename):
   """
   Uploads an image to S3 with a unique name, allowing the same local
@@ -374,38 +571,31 @@ def post_image(userid, local_filename):
   image's assetid upon success, raises an exception on error
   """
   try :
-    url = _build_url(f"/image/{userid}")
+    url = _URL_IMAGE_PREFIX + str(userid)
 
     filename = _validate_local_filename(local_filename)
 
-    infile = open(filename, 'rb')
-    image_bytes = infile.read()
-    infile.close()
-
-    encoded_bytes = base64.b64encode(image_bytes)
-    image_str = encoded_bytes.decode()
-    data = {
-      'local_filename': os.path.basename(filename),
-      "data": image_str
-    }
+    #
+    # the JSON body is generated as the file is read, so the image
+    # is never held in memory whole (raw or base64-encoded):
+    #
+    with open(filename, 'rb') as infile, _map_file(infile) as image:
 # params CREATES A QUERY PARAMETER, but we want a url parameterer. Stupid
-    response = requests.post(url, json=data)
-    status_code = response.status_code
-    body = _safe_json(response)
-    if status_code == 200:
-      return body['assetid']
-    else:
-      msg = body['message']
-      #
-      # NOTE: this exception will not trigger retry mechanism, 
-      # since we reached the server and the server-side failed, 
-      # and we are assuming the server-side is also doing retries.
-      #
-      raise ValueError(msg)
+      response = _do('POST', url,
+                     make_data=lambda: _json_upload_body(filename, image),
+                     headers={'Content-Type': 'application/json'},
+                     timeout=_POST_TIMEOUT)
+    body = _require_200(response, bad_id_on_400=True)
+
+    #
+    # the new image has labels, so cached label results are stale:
+    #
+    _clear_label_caches()
+    return body['assetid']
   
   except Exception as err:
-    logging.error("post_image():")
-    logging.error(str(err))
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "post_image", err)
     raise
   finally:
     # nothing to do
@@ -415,19 +605,15 @@ def post_image(userid, local_filename):
 #
 # get_image
 #
-@retry(stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((ConnectionError, Timeout)),
-        reraise=True
-      )
-def get_image(assetid, local_filename = None):
+def get_image(assetid, local_filename = None, local_dir = None):
   """
   Downloads the image from S3 denoted by the provided asset. If a
   local_filename is provided, the newly-downloaded file is saved
   with this filename (overwriting any existing file with this name).
   If a local_filename is not provided, the newly-downloaded file
   is saved using the local filename that was saved in the database
-  when the file was uploaded. If successful, the filename for the
+  when the file was uploaded. If a local_dir is provided, the file
+  is saved in that directory. If successful, the filename for the
   newly-downloaded file is returned; if an error occurs then an
   exception is raised. An invalid assetid is considered a
   ValueError, "no such assetid".
@@ -436,37 +622,73 @@ def get_image(assetid, local_filename = None):
   ----------
   assetid of image to download
   local filename (optional) for newly-downloaded image
+  local directory (optional) to save the newly-downloaded image in
   
   Returns
   -------
   local filename for the newly-downloaded file, or raises an 
   exception upon error
   """
-  
+
+  return _get_image(assetid, local_filename, local_dir)
+
+
+def _get_image(assetid, local_filename, local_dir, claim=None):
+  #
+  # body of get_image; when no local_filename is given, claim (if
+  # any) is called as claim(assetid, stored_filename) and returns
+  # the filename to save under instead of the stored one:
+  #
   try:
-    url = _build_url(f"/image/{assetid}")
-    response = requests.get(url)
+    url = _URL_IMAGE_PREFIX + str(assetid)
+    #
+    # ask for the raw image bytes and stream them straight to disk;
+    # a web service that doesn't support raw=1 still answers with
+    # JSON, which we fall back to:
+    #
+    response = _do('GET', url, params={'raw': 1}, stream=True)
     
     if response.status_code == 200:
+      content_type = response.headers.get('Content-Type', '')
+
+      if content_type.startswith('application/octet-stream'):
+        #
+        # success, raw bytes:
+        #
+        original_filename = unquote(response.headers['X-Local-Filename'])
+
+        filename_to_save = _filename_to_save(assetid, original_filename,
+                                             local_filename, local_dir, claim)
+
+        with open(filename_to_save, 'wb') as outfile:
+          for chunk in response.iter_content(_DOWNLOAD_CHUNKSIZE):
+            outfile.write(chunk)
+
+        return filename_to_save
+
       body = _safe_json(response)
       #
       # success
       #
       original_filename = body['local_filename']
       image_base64 = body['data']
+      del body
       
-      image_bytes = base64.b64decode(image_base64)
-      
-      filename_to_save = local_filename if local_filename is not None else original_filename
+      filename_to_save = _filename_to_save(assetid, original_filename,
+                                           local_filename, local_dir, claim)
       
+      #
+      # decode a slice at a time so we never hold the decoded image
+      # in memory alongside the base64 string:
+      #
       with open(filename_to_save, 'wb') as outfile:
-        outfile.write(image_bytes)
+        for i in range(0, len(image_base64), _B64_SLICE):
+          outfile.write(base64.b64decode(image_base64[i:i + _B64_SLICE]))
       
       return filename_to_save
     
     elif response.status_code in [400, 500]:
-      body = _safe_json(response)
-      msg = body['message']
+      msg = _error_message(response)
       #
       # NOTE: this exception will not trigger retry mechanism, 
       # since we reached the server and the server-side failed, 
@@ -481,23 +703,84 @@ def get_image(assetid, local_filename = None):
       response.raise_for_status()
   
   except Exception as err:
-    logging.error("get_image():")
-    logging.error(str(err))
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "get_image", err)
 
     raise
   
   finally:
     pass
 
+###################################################################
+#
+# get_images_bulk
+#
+def get_images_bulk(assetids, local_dir, max_concurrency = 8):
+  """
+  Downloads several images at once, saving each into local_dir
+  under the local filename saved in the database when it was
+  uploaded. If several of the images were uploaded under the same
+  filename, one keeps it and the others are saved as
+  "<assetid>_<filename>", so no image overwrites another. The downloads run concurrently over
+  the shared HTTP session, at most max_concurrency at a time
+  (capped at the size of the session's connection pool). Returns
+  the list of local filenames, in the same order as the given
+  assetids. If any download fails an exception is raised.
+
+  Parameters
+  ----------
+  assetids of the images to download
+  local directory to save the images in
+  max_concurrency (optional) # of downloads in flight at once
+
+  Returns
+  -------
+  list of local filenames for the newly-downloaded files, or raises
+  an exception upon error
+  """
+
+  try:
+    assetids = list(assetids)
+    workers = max(1, min(max_concurrency, _POOL_MAXSIZE))
+
+    os.makedirs(local_dir, exist_ok=True)
+
+    #
+    # the same file can be uploaded more than once, so two different
+    # assets may share a stored filename. As each download learns
+    # its name it claims it; a name already claimed gets the assetid
+    # prefixed. Together with downloading each distinct asset once,
+    # this means two threads never write the same file:
+    #
+    claimed = set()
+    claimed_lock = threading.Lock()
+
+    def claim(assetid, filename):
+      with claimed_lock:
+        if filename in claimed:
+          filename = f"{assetid}_{filename}"
+          if filename in claimed:
+            raise ValueError(f"no unique local filename for assetid {assetid}")
+        claimed.add(filename)
+        return filename
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      futures = {assetid: executor.submit(_get_image, assetid, None, local_dir, claim)
+                 for assetid in dict.fromkeys(assetids)}
+
+      return [futures[assetid].result() for assetid in assetids]
+
+  except Exception as err:
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "get_images_bulk", err)
+    raise
+
+
 ###################################################################
 #
 # get_image_labels
 #
-@retry(stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((ConnectionError, Timeout)),
-        reraise=True
-      )
+@cached(_IMAGE_LABELS_CACHE, lock=_CACHE_LOCK)
 def get_image_labels(assetid):
   """
   When an image is uploaded to S3, the Rekognition AI service is
@@ -524,46 +807,18 @@ def get_image_labels(assetid):
   """
 
   try:
-    url = _build_url(f"/image_labels/{assetid}")
-
-    response = requests.get(url)
-
-    if response.status_code == 200:
-      body = _safe_json(response)
-      #
-      # success
-      #
-      rows = body['data']
-
-      labels = []
-
-      for row in rows:
-        label = row["label"]
-        confidence = row["confidence"]
-        labels.append((label, confidence))
+    url = _URL_IMAGE_LABELS_PREFIX + str(assetid)
 
-      return labels
+    response = _do('GET', url)
 
-    elif response.status_code == 400:
-      body = _safe_json(response)
-      msg = body['message']
-      raise ValueError(msg)
-
-    elif response.status_code == 500:
-      body = _safe_json(response)
-      msg = body['message']
-      err_msg = f"status code {response.status_code}: {msg}"
-      raise HTTPError(err_msg)
+    body = _require_200(response, bad_id_on_400=True)
+    rows = body['data']
 
-    else:
-      #
-      # Any other error (404, etc.)
-      #
-      response.raise_for_status()
+    return list(map(_LBL_GET, rows))
 
   except Exception as err:
-    logging.error("get_image_labels():")
-    logging.error(str(err))
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "get_image_labels", err)
 
     raise
 
@@ -574,11 +829,7 @@ def get_image_labels(assetid):
 #
 # get_images_with_label
 #
-@retry(stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((ConnectionError, Timeout)),
-        reraise=True
-      )
+@cached(_IMAGES_WITH_LABEL_CACHE, lock=_CACHE_LOCK)
 def get_images_with_label(label):
   """
   When an image is uploaded to S3, the Rekognition AI service is
@@ -607,47 +858,18 @@ def get_images_with_label(label):
   """
 
   try:
-    url = _build_url(f"/images_with_label/{label}")
-
-    response = requests.get(url)
+    url = _URL_IMAGES_WITH_LABEL_PREFIX + str(label)
 
-    if response.status_code == 200:
-      body = _safe_json(response)
-      #
-      # success
-      #
-      rows = body['data']
+    response = _do('GET', url)
 
-      labels = []
+    body = _require_200(response, bad_id_on_400=True)
+    rows = body['data']
 
-      for row in rows:
-        assetid = row["assetid"]
-        label = row["label"]
-        confidence = row["confidence"]
-        labels.append((assetid, label, confidence))
-
-      return labels
-
-    elif response.status_code == 400:
-      body = _safe_json(response)
-      msg = body['message']
-      raise ValueError(msg)
-
-    elif response.status_code == 500:
-      body = _safe_json(response)
-      msg = body['message']
-      err_msg = f"status code {response.status_code}: {msg}"
-      raise HTTPError(err_msg)
-
-    else:
-      #
-      # Any other error (404, etc.)
-      #
-      response.raise_for_status()
+    return list(map(_IMGLBL_GET, rows))
 
   except Exception as err:
-    logging.error("get_images_with_label():")
-    logging.error(str(err))
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "get_images_with_label", err)
 
     raise
 
@@ -658,11 +880,6 @@ def get_images_with_label(label):
 #
 # delete_images
 #
-@retry(stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((ConnectionError, Timeout)),
-        reraise=True
-      )
 def delete_images():
   """
   Delete all images and associated labels from the database and 
@@ -683,35 +900,19 @@ def delete_images():
   """
 
   try:
-    url = _build_url("/images")
+    url = _URL_IMAGES
 
-    response = requests.delete(url)
-    body = _safe_json(response)
+    response = _do('DELETE', url)
 
-    if response.status_code == 200:
-      #
-      # success
-      #
-      return True
-    else:
-      #
-      # failed:
-      #
-      msg = body['message']
-      err_msg = f"status code {response.status_code}: {msg}"
-      #
-      # NOTE: this exception will not trigger retry mechanism, 
-      # since we reached the server and the server-side failed, 
-      # and we are assuming the server-side is also doing retries.
-      #
-      raise HTTPError(err_msg)
+    _require_200(response)
+
+    _clear_label_caches()
+    get_users.cache_clear()
+    return True
 
   except Exception as err:
-    logging.error("delete_images():")
-    logging.error(str(err))
-    #
-    # raise exception to trigger retry mechanism if appropriate:
-    #
+    if _log.isEnabledFor(logging.ERROR):
+      _log.error("%s(): %s", "delete_images", err)
     raise
 
   finally:
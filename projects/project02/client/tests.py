@@ -9,6 +9,8 @@
 import photoapp
 import unittest
 import sys
+import os
+import tempfile
 import logging
 
 
@@ -56,6 +58,39 @@ class PhotoappTests(unittest.TestCase):
 
     print("test passed!")
 
+  def test_04(self):
+    print()
+    print("** test_04: get_images_bulk with duplicate filenames **")
+
+    #
+    # the same file uploaded twice gives two assets with the same
+    # stored filename; each must be saved to its own file:
+    #
+    a1 = photoapp.post_image(80001, '01degu.jpg')
+    a2 = photoapp.post_image(80001, '01degu.jpg')
+    a3 = photoapp.post_image(80001, '02earth.jpg')
+
+    try:
+      with tempfile.TemporaryDirectory() as local_dir:
+        files = photoapp.get_images_bulk([a1, a2, a3, a1], local_dir)
+
+        self.assertEqual(len(files), 4)
+        self.assertEqual(files[0], files[3])
+        self.assertEqual(len(set(files)), 3)
+        self.assertEqual(os.path.basename(files[2]), '02earth.jpg')
+
+        with open('01degu.jpg', 'rb') as infile:
+          original = infile.read()
+
+        for filename in files[:2]:
+          with open(filename, 'rb') as infile:
+            self.assertEqual(infile.read(), original)
+
+    finally:
+      photoapp.delete_images()
+
+    print("test passed!")
+
 
 ############################################################
 #
@@ -8,6 +8,7 @@
 //   Northwestern University
 //
 const { GetObjectCommand } = require('@aws-sdk/client-s3');
+const { pipeline } = require('stream');
 const { get_dbConn, get_bucket, get_bucket_name } = require('./helper.js');
 
 const pRetry = (...args) => import('p-retry').then(({default: pRetry}) => pRetry(...args));
@@ -89,6 +90,13 @@ encoded string
 */
 exports.get_image = async (request, response) => {
 
+  //
+  // ?raw=1 sends the image bytes as application/octet-stream, with
+  // userid and local filename in X-Userid / X-Local-Filename headers,
+  // instead of a JSON body with base64-encoded data:
+  //
+  const raw = request.query.raw === '1';
+
   async function try_get_image() {
     let dbConn = null;
     try {
@@ -127,6 +135,21 @@ exports.get_image = async (request, response) => {
 
       const s3_response = await bucket.send(command);
 
+      if (raw) {
+        //
+        // caller wants the raw bytes, so hand back the S3 stream
+        // rather than reading and encoding it here:
+        //
+        console.log(`success, streaming ${localname}`);
+
+        return {
+          userid: userid,
+          local_filename: localname,
+          length: s3_response.ContentLength,
+          body: s3_response.Body
+        };
+      }
+
       const image_base64 = await s3_response.Body.transformToString('base64');
 
       console.log(`success, downloaded ${localname}`);
@@ -162,6 +185,29 @@ exports.get_image = async (request, response) => {
 
     const result = await pRetry(try_get_image, { retries: 2 });
 
+    if (raw) {
+      response.set('Content-Type', 'application/octet-stream');
+      response.set('X-Userid', String(result.userid));
+      response.set('X-Local-Filename', encodeURIComponent(result.local_filename));
+      if (result.length !== undefined) {
+        // lets the client detect a download cut short:
+        response.set('Content-Length', String(result.length));
+      }
+
+      //
+      // the headers are already sent, so if the S3 stream fails all
+      // we can do is log it; pipeline() destroys the response, which
+      // the client sees as a truncated body:
+      //
+      pipeline(result.body, response, (err) => {
+        if (err) {
+          console.log("ERROR streaming image:");
+          console.log(err.message);
+        }
+      });
+      return;
+    }
+
     response.json({
       "message": "success",
       "userid": result.userid,
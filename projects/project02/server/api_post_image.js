@@ -7,7 +7,14 @@
 //   Prof. Joe Hummel
 //   Northwestern University
 //
-const {PutObjectCommand, DeleteObjectCommand} = require('@aws-sdk/client-s3');
+const {
+  PutObjectCommand,
+  DeleteObjectCommand,
+  CreateMultipartUploadCommand,
+  UploadPartCommand,
+  CompleteMultipartUploadCommand,
+  AbortMultipartUploadCommand
+} = require('@aws-sdk/client-s3');
 const {DetectLabelsCommand} = require('@aws-sdk/client-rekognition');
 const uuid = require('uuid');
 const mysql2 = require('mysql2/promise');
@@ -18,6 +25,18 @@ const { get_dbConn, get_bucket, get_bucket_name, get_rekognition } = require('./
 //
 const pRetry = (...args) => import('p-retry').then(({default: pRetry}) => pRetry(...args));
 
+//
+// images larger than MULTIPART_THRESHOLD are uploaded to S3 as
+// MULTIPART_CHUNKSIZE parts, MULTIPART_CONCURRENCY at a time. Parts
+// are S3's 5 MB minimum, since Rekognition only labels S3 objects up
+// to 15 MB: larger parts would leave most uploads as a single part
+// with nothing to run in parallel:
+//
+const MB = 1024 * 1024;
+const MULTIPART_THRESHOLD = 8 * MB;
+const MULTIPART_CHUNKSIZE = 5 * MB;
+const MULTIPART_CONCURRENCY = 16;
+
 /**
 *
 post_image
@@ -107,13 +126,79 @@ exports.post_image = async (request, response) => {
 
   async function upload_to_s3(bucketkey, image_bytes) {
     const bucket = get_bucket();
-    const parameters = {
-      Bucket: get_bucket_name(),
+
+    //
+    // small images go up in a single PUT:
+    //
+    if (image_bytes.length <= MULTIPART_THRESHOLD) {
+      const parameters = {
+        Bucket: get_bucket_name(),
+        Key: bucketkey,
+        Body: image_bytes,
+      };
+      let command = new PutObjectCommand(parameters);
+      await bucket.send(command);
+      return;
+    }
+
+    //
+    // larger images are uploaded as a multipart upload, with up to
+    // MULTIPART_CONCURRENCY parts in flight at once:
+    //
+    const bucket_name = get_bucket_name();
+    const create_command = new CreateMultipartUploadCommand({
+      Bucket: bucket_name,
       Key: bucketkey,
-      Body: image_bytes,
-    };
-    let command = new PutObjectCommand(parameters);
-    await bucket.send(command);
+    });
+    const { UploadId } = await bucket.send(create_command);
+
+    try {
+      const num_parts = Math.ceil(image_bytes.length / MULTIPART_CHUNKSIZE);
+      const parts = new Array(num_parts);
+      let next_part = 0;
+
+      async function upload_parts() {
+        while (next_part < num_parts) {
+          const i = next_part++;
+          const start = i * MULTIPART_CHUNKSIZE;
+          const part_command = new UploadPartCommand({
+            Bucket: bucket_name,
+            Key: bucketkey,
+            UploadId: UploadId,
+            PartNumber: i + 1,
+            Body: image_bytes.subarray(start, start + MULTIPART_CHUNKSIZE),
+          });
+          const { ETag } = await bucket.send(part_command);
+          parts[i] = { ETag: ETag, PartNumber: i + 1 };
+        }
+      }
+
+      const workers = [];
+      for (let w = 0; w < Math.min(MULTIPART_CONCURRENCY, num_parts); w++) {
+        workers.push(upload_parts());
+      }
+      await Promise.all(workers);
+
+      const complete_command = new CompleteMultipartUploadCommand({
+        Bucket: bucket_name,
+        Key: bucketkey,
+        UploadId: UploadId,
+        MultipartUpload: { Parts: parts },
+      });
+      await bucket.send(complete_command);
+    }
+    catch (err) {
+      try {
+        await bucket.send(new AbortMultipartUploadCommand({
+          Bucket: bucket_name,
+          Key: bucketkey,
+          UploadId: UploadId,
+        }));
+      } catch (abortErr) {
+        console.log("Abort ERROR:", abortErr.message);
+      }
+      throw err;
+    }
   }
 
 